@@ -0,0 +1,66 @@
+import argparse
+import gzip
+import json
+import os
+import time
+from decimal import Decimal
+import boto3
+
+# ============================================
+# BUILD CATALOG SNAPSHOT
+# ============================================
+# Scans each campus's Courses table once and writes the compact snapshot that
+# lambda_function.py preloads during init. Run it as part of packaging:
+#
+#   python build_catalog_snapshot.py                       # default tenant only
+#   TENANTS='{...}' python build_catalog_snapshot.py --tenant main --tenant north
+#
+# then ship catalog_snapshot.json.gz next to lambda_function.py.
+
+SNAPSHOT_VERSION = 1  # keep in sync with CATALOG_SNAPSHOT_VERSION in lambda_function.py
+
+parser = argparse.ArgumentParser(description="Build the course catalog snapshot loaded at Lambda init")
+parser.add_argument('--tenant', action='append',
+                    help="Tenant from the TENANTS env var (repeatable, default: every tenant)")
+parser.add_argument('--output', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'catalog_snapshot.json.gz'))
+args = parser.parse_args()
+
+tenants = json.loads(os.environ.get('TENANTS', '{}')) or {'default': {}}
+names = args.tenant or list(tenants)
+
+
+def to_json(value):
+    # DynamoDB returns every number as Decimal
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+
+def scan_courses(name):
+    config = tenants.get(name)
+    if config is None:
+        raise SystemExit(f"❌ Tenant {name} is not defined in TENANTS")
+    dynamodb = boto3.resource('dynamodb', region_name=config.get('region') or 'us-east-1')
+    table = dynamodb.Table(config.get('table_prefix', '') + 'Courses')
+
+    items = []
+    response = table.scan()
+    items.extend(response.get('Items', []))
+    while 'LastEvaluatedKey' in response:
+        response = table.scan(ExclusiveStartKey=response['LastEvaluatedKey'])
+        items.extend(response.get('Items', []))
+    print(f"✅ {name}: {len(items)} courses from {table.name}")
+    return items
+
+
+snapshot = {
+    'version': SNAPSHOT_VERSION,
+    'generated_at': int(time.time()),
+    'tenants': {name: scan_courses(name) for name in names}
+}
+
+payload = json.dumps(snapshot, default=to_json, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+with gzip.open(args.output, 'wb', compresslevel=9) as f:
+    f.write(payload)
+
+print(f"\n📦 Wrote {args.output} ({os.path.getsize(args.output)} bytes, {len(payload)} uncompressed)")
@@ -1,89 +1,118 @@
+import argparse
+import json
+import os
+import threading
 import boto3
+from botocore.config import Config
 from botocore.exceptions import ClientError
+from concurrent.futures import ThreadPoolExecutor
 import uuid
 from datetime import datetime
 from decimal import Decimal  # ← Add this import
 
-dynamodb = boto3.resource('dynamodb', region_name='us-east-1')
+# ============================================
+# TENANT SELECTION
+# ============================================
+# Usage:
+#   python create_dynamodb_tables.py                          # Courses, Registrations... in us-east-1
+#   python create_dynamodb_tables.py --tenant north           # region/prefix from the TENANTS env var
+#   python create_dynamodb_tables.py --region us-west-2 --prefix north-
+
+parser = argparse.ArgumentParser(description="Create and seed one campus's DynamoDB tables")
+parser.add_argument('--tenant', help="Tenant name looked up in the TENANTS JSON env var (same as the Lambda)")
+parser.add_argument('--region', help="AWS region (default: tenant's region or us-east-1)")
+parser.add_argument('--prefix', help="Table name prefix (default: tenant's table_prefix or none)")
+args = parser.parse_args()
+
+tenant_config = {}
+if args.tenant:
+    tenant_config = json.loads(os.environ.get('TENANTS', '{}')).get(args.tenant)
+    if tenant_config is None:
+        raise SystemExit(f"❌ Tenant {args.tenant} is not defined in TENANTS")
+
+REGION = args.region or tenant_config.get('region') or 'us-east-1'
+PREFIX = args.prefix if args.prefix is not None else tenant_config.get('table_prefix', '')
+TABLE_NAMES = ["Students", "Courses", "Registrations"]
+
+print(f"🏫 Tenant: {args.tenant or 'default'} | Region: {REGION} | Table prefix: '{PREFIX}'\n")
+
+# boto3 resources are not thread-safe, so each worker thread gets its own
+_local = threading.local()
+POOL_CONFIG = Config(max_pool_connections=len(TABLE_NAMES) * 2)
+
+def get_dynamodb():
+    if not hasattr(_local, 'dynamodb'):
+        _local.dynamodb = boto3.resource('dynamodb', region_name=REGION, config=POOL_CONFIG)
+    return _local.dynamodb
+
+def run_parallel(fn, names):
+    with ThreadPoolExecutor(max_workers=len(names)) as pool:
+        list(pool.map(fn, names))
+
+dynamodb = get_dynamodb()
 
 print("🗑️  Deleting existing tables (if any)...")
 
 # Delete existing tables
-for table_name in ["Students", "Courses", "Registrations"]:
+def delete_table(table_name):
     try:
-        table = dynamodb.Table(table_name)
+        table = get_dynamodb().Table(PREFIX + table_name)
         table.delete()
         table.wait_until_not_exists()
-        print(f"✅ Deleted: {table_name}")
+        print(f"✅ Deleted: {PREFIX + table_name}")
     except ClientError as e:
         if "ResourceNotFoundException" in str(e):
-            print(f"⚠️  {table_name} doesn't exist, skipping deletion")
+            print(f"⚠️  {PREFIX + table_name} doesn't exist, skipping deletion")
         else:
-            print(f"❌ Error deleting {table_name}: {e}")
+            print(f"❌ Error deleting {PREFIX + table_name}: {e}")
+
+run_parallel(delete_table, TABLE_NAMES)
 
 print("\n🔨 Creating fresh tables...\n")
 
 # ============================================
-# 1. STUDENTS TABLE
+# TABLE DEFINITIONS
 # ============================================
-try:
-    students_table = dynamodb.create_table(
-        TableName='Students',
-        KeySchema=[
+TABLE_DEFINITIONS = {
+    # 1. STUDENTS TABLE
+    'Students': {
+        'KeySchema': [
             {'AttributeName': 'student_id', 'KeyType': 'HASH'}
         ],
-        AttributeDefinitions=[
+        'AttributeDefinitions': [
             {'AttributeName': 'student_id', 'AttributeType': 'S'},
             {'AttributeName': 'email', 'AttributeType': 'S'}
         ],
-        GlobalSecondaryIndexes=[
+        'GlobalSecondaryIndexes': [
             {
                 'IndexName': 'email-index',
                 'KeySchema': [{'AttributeName': 'email', 'KeyType': 'HASH'}],
                 'Projection': {'ProjectionType': 'ALL'}
             }
         ],
-        BillingMode='PAY_PER_REQUEST'
-    )
-    students_table.wait_until_exists()
-    print("✅ Created: Students (with email GSI)")
-except ClientError as e:
-    print(f"❌ Error creating Students: {e}")
-
-# ============================================
-# 2. COURSES TABLE
-# ============================================
-try:
-    courses_table = dynamodb.create_table(
-        TableName='Courses',
-        KeySchema=[
+        'label': "(with email GSI)"
+    },
+    # 2. COURSES TABLE
+    'Courses': {
+        'KeySchema': [
             {'AttributeName': 'course_id', 'KeyType': 'HASH'}
         ],
-        AttributeDefinitions=[
+        'AttributeDefinitions': [
             {'AttributeName': 'course_id', 'AttributeType': 'S'}
         ],
-        BillingMode='PAY_PER_REQUEST'
-    )
-    courses_table.wait_until_exists()
-    print("✅ Created: Courses")
-except ClientError as e:
-    print(f"❌ Error creating Courses: {e}")
-
-# ============================================
-# 3. REGISTRATIONS TABLE
-# ============================================
-try:
-    registrations_table = dynamodb.create_table(
-        TableName='Registrations',
-        KeySchema=[
+        'label': ""
+    },
+    # 3. REGISTRATIONS TABLE
+    'Registrations': {
+        'KeySchema': [
             {'AttributeName': 'registration_id', 'KeyType': 'HASH'}
         ],
-        AttributeDefinitions=[
+        'AttributeDefinitions': [
             {'AttributeName': 'registration_id', 'AttributeType': 'S'},
             {'AttributeName': 'student_id', 'AttributeType': 'S'},
             {'AttributeName': 'course_id', 'AttributeType': 'S'}
         ],
-        GlobalSecondaryIndexes=[
+        'GlobalSecondaryIndexes': [
             {
                 'IndexName': 'student-index',
                 'KeySchema': [{'AttributeName': 'student_id', 'KeyType': 'HASH'}],
@@ -95,12 +124,25 @@ try:
                 'Projection': {'ProjectionType': 'ALL'}
             }
         ],
-        BillingMode='PAY_PER_REQUEST'
-    )
-    registrations_table.wait_until_exists()
-    print("✅ Created: Registrations (with student & course GSIs)")
-except ClientError as e:
-    print(f"❌ Error creating Registrations: {e}")
+        'label': "(with student & course GSIs)"
+    }
+}
+
+def create_table(table_name):
+    definition = dict(TABLE_DEFINITIONS[table_name])
+    label = definition.pop('label')
+    try:
+        table = get_dynamodb().create_table(
+            TableName=PREFIX + table_name,
+            BillingMode='PAY_PER_REQUEST',
+            **definition
+        )
+        table.wait_until_exists()
+        print(f"✅ Created: {PREFIX + table_name} {label}".rstrip())
+    except ClientError as e:
+        print(f"❌ Error creating {PREFIX + table_name}: {e}")
+
+run_parallel(create_table, TABLE_NAMES)
 
 print("\n📦 Inserting mock data...\n")
 
@@ -295,19 +337,18 @@ registrations = [
 # ============================================
 
 def insert_data(table_name, items):
-    table = dynamodb.Table(table_name)
-    success_count = 0
-    for item in items:
-        try:
-            table.put_item(Item=item)
-            success_count += 1
-        except ClientError as e:
-            print(f"❌ Error inserting into {table_name}: {e}")
-    print(f"✅ Inserted {success_count}/{len(items)} items into {table_name}")
+    table = get_dynamodb().Table(PREFIX + table_name)
+    try:
+        # batch_writer groups puts into BatchWriteItem calls and retries unprocessed items
+        with table.batch_writer() as batch:
+            for item in items:
+                batch.put_item(Item=item)
+        print(f"✅ Inserted {len(items)}/{len(items)} items into {PREFIX + table_name}")
+    except ClientError as e:
+        print(f"❌ Error inserting into {PREFIX + table_name}: {e}")
 
-insert_data("Students", students)
-insert_data("Courses", courses)
-insert_data("Registrations", registrations)
+seed_data = {"Students": students, "Courses": courses, "Registrations": registrations}
+run_parallel(lambda table_name: insert_data(table_name, seed_data[table_name]), TABLE_NAMES)
 
 print("\n🎉 Database setup complete!\n")
 
@@ -318,7 +359,7 @@ print("\n🎉 Database setup complete!\n")
 print("🔍 Running verification queries...\n")
 
 # Query 1: List all courses with available spots
-courses_table = dynamodb.Table('Courses')
+courses_table = dynamodb.Table(PREFIX + 'Courses')
 response = courses_table.scan()
 print("📚 COURSES WITH AVAILABILITY:")
 for course in response['Items']:
@@ -327,7 +368,7 @@ for course in response['Items']:
     print(f"   {status} {course['course_id']} - {course['course_name']} ({available}/{course['capacity']} spots)")
 
 # Query 2: Alice's registrations
-registrations_table = dynamodb.Table('Registrations')
+registrations_table = dynamodb.Table(PREFIX + 'Registrations')
 response = registrations_table.query(
     IndexName='student-index',
     KeyConditionExpression='student_id = :sid',
@@ -345,7 +386,7 @@ response = registrations_table.query(
     ExpressionAttributeValues={':cid': 'CS101'}
 )
 print(f"\n📖 CS101 ENROLLMENT:")
-students_table = dynamodb.Table('Students')
+students_table = dynamodb.Table(PREFIX + 'Students')
 for reg in response['Items']:
     student = students_table.get_item(Key={'student_id': reg['student_id']})['Item']
     print(f"   • {student['name']} ({student['student_id']})")
@@ -1,28 +1,528 @@
 import json
+import os
+import re
+import hashlib
+import hmac
+import base64
+import gzip
+import zlib
+import time
+import threading
 import boto3
 import uuid
 import logging
+from collections import deque
 from datetime import datetime
+from botocore.config import Config
+from boto3.dynamodb.types import TypeSerializer
+from botocore.exceptions import BotoCoreError, ClientError
 
 # Configure logging
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
-# Initialize DynamoDB
-dynamodb = boto3.resource('dynamodb')
+# DynamoDB client policy (overridable through Lambda environment variables).
+# Defaults are sized so one attempt fits in AWS's default 3s Lambda timeout.
+DDB_CONNECT_TIMEOUT = float(os.environ.get('DDB_CONNECT_TIMEOUT', '0.5'))
+DDB_READ_TIMEOUT = float(os.environ.get('DDB_READ_TIMEOUT', '1'))
+DDB_MAX_ATTEMPTS = int(os.environ.get('DDB_MAX_ATTEMPTS', '3'))
+DYNAMODB_CONFIG = Config(
+    connect_timeout=DDB_CONNECT_TIMEOUT,
+    read_timeout=DDB_READ_TIMEOUT,
+    retries={
+        'mode': 'adaptive',
+        'max_attempts': DDB_MAX_ATTEMPTS
+    },
+    max_pool_connections=int(os.environ.get('DDB_MAX_POOL_CONNECTIONS', '10')),
+    tcp_keepalive=True
+)
+
+# Circuit breaker settings (shared by every table)
+BREAKER_WINDOW = int(os.environ.get('BREAKER_WINDOW', '20'))
+BREAKER_MIN_CALLS = int(os.environ.get('BREAKER_MIN_CALLS', '5'))
+BREAKER_ERROR_RATE = float(os.environ.get('BREAKER_ERROR_RATE', '0.5'))
+BREAKER_COOLDOWN = float(os.environ.get('BREAKER_COOLDOWN', '10'))
+
+# The function's configured timeout; set this whenever the Lambda timeout is changed
+LAMBDA_TIMEOUT_MS = int(os.environ.get('LAMBDA_TIMEOUT_MS', '3000'))
+# Time kept back from the deadline to build and return a reply: DEADLINE_MARGIN_MS, but never
+# more than DEADLINE_MARGIN_FRACTION of the time that is left
+DEADLINE_MARGIN_MS = int(os.environ.get('DEADLINE_MARGIN_MS', '1500'))
+DEADLINE_MARGIN_FRACTION = float(os.environ.get('DEADLINE_MARGIN_FRACTION', '0.2'))
+# A call only starts if one full attempt (connect + read timeout) still fits before the margin.
+# Limitation: botocore retries and adaptive back-off are not bounded by the deadline, so a call
+# can still take up to DDB_MAX_ATTEMPTS attempts plus back-off.
+ATTEMPT_BUDGET_MS = (DDB_CONNECT_TIMEOUT + DDB_READ_TIMEOUT) * 1000
+
+# How long a catalog scan is served from memory before it is refreshed
+CATALOG_CACHE_TTL = float(os.environ.get('CATALOG_CACHE_TTL', '60'))
+# Per-tenant memory cap for cached catalog data (bytes of JSON)
+TENANT_CACHE_MAX_BYTES = int(os.environ.get('TENANT_CACHE_MAX_BYTES', str(256 * 1024)))
+
+# Campuses served by this deployment, e.g.
+# {"main": {"region": "us-east-1"}, "north": {"region": "us-west-2", "table_prefix": "north-", "aliases": ["north-prod"]}}
+# Without TENANTS every request uses the plain Courses/Registrations tables.
+TENANTS = json.loads(os.environ.get('TENANTS', '{}')) or {'default': {}}
+DEFAULT_TENANT = os.environ.get('DEFAULT_TENANT', next(iter(TENANTS)))
+TENANT_ATTRIBUTE = 'campus'
+
+# Precompiled course catalog produced by build_catalog_snapshot.py and shipped with the function
+CATALOG_SNAPSHOT = os.environ.get(
+    'CATALOG_SNAPSHOT',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'catalog_snapshot.json.gz')
+)
+CATALOG_SNAPSHOT_VERSION = 1
+# Events carrying this key (or EventBridge schedules) only keep the container warm
+WARM_PING_KEY = 'warmPing'
+
+# Opt-in: log a sanitized copy of every event/response for replay_transcripts.py
+CAPTURE_TRANSCRIPTS = os.environ.get('CAPTURE_TRANSCRIPTS', '').lower() in ('1', 'true', 'yes')
+# Secret for the keyed pseudonyms; student IDs are too guessable for a plain hash
+CAPTURE_HMAC_KEY = os.environ.get('CAPTURE_HMAC_KEY', '').encode('utf-8')
+if CAPTURE_TRANSCRIPTS and not CAPTURE_HMAC_KEY:
+    logger.error("CAPTURE_TRANSCRIPTS is set without CAPTURE_HMAC_KEY; transcript capture is disabled")
+    CAPTURE_TRANSCRIPTS = False
+TRANSCRIPT_MARKER = 'TRANSCRIPT '
+# Every identity attribute the frontend sends (src/services/chatbotService.js)
+SENSITIVE_ATTRIBUTES = ('cognito_username', 'email', 'name', 'student_id')
+# Lex V2 fields holding what the student typed or said; replaced outright since
+# they can contain anything, not just the values above
+FREE_TEXT_FIELDS = ('inputTranscript', 'rawInputTranscript', 'transcription', 'originalValue')
+REDACTED = '[redacted]'
+
+# Typed session fields packed into one sessionAttribute: name -> (short key, type,
+# max JSON length), e.g. 'course_cursor': ('c', str, 16). The length cap keeps the
+# worst case inside SESSION_SIZE_BUDGET (see test_session_state.py). Only add a field once a handler reads it back;
+# until then no '_s' attribute is sent. Bump SESSION_SCHEMA_VERSION whenever a
+# short key is reused or a type changes.
+SESSION_STATE_KEY = '_s'
+SESSION_SCHEMA_VERSION = 1
+SESSION_SCHEMA = {}
+# Upper bound for the whole sessionAttributes map echoed back to Lex (bytes of JSON)
+SESSION_SIZE_BUDGET = int(os.environ.get('SESSION_SIZE_BUDGET', '1024'))
+
+UNKNOWN_CAMPUS_MESSAGE = "I couldn’t tell which campus you belong to. Please sign in again."
+TRY_AGAIN_MESSAGE = "⏳ Our course system is busy right now. Please try again shortly."
+
+# Error codes that mean DynamoDB (not the request) is the problem
+TRANSIENT_ERROR_CODES = {
+    'ProvisionedThroughputExceededException',
+    'ThrottlingException',
+    'RequestLimitExceeded',
+    'InternalServerError',
+    'ServiceUnavailable',
+    'TransactionConflictException'
+}
+# TransactionCanceledException reasons that mean "try again" rather than a failed condition
+TRANSIENT_CANCELLATION_CODES = {'TransactionConflict', 'ThrottlingError', 'ProvisionedThroughputExceeded'}
 
-# DynamoDB tables
-courses_table = dynamodb.Table('Courses')
-registrations_table = dynamodb.Table('Registrations')
+# -------------------------
+#   RESILIENCE
+# -------------------------
+class TableUnavailableError(Exception):
+    """Raised when a table call is refused by its breaker or the deadline."""
+
+
+class UnknownTenantError(Exception):
+    """Raised when a request names a campus this deployment does not serve."""
+
+
+class CircuitBreaker:
+    """Per-table breaker that opens once the recent error rate crosses a threshold."""
+
+    def __init__(self, name):
+        self.name = name
+        self.outcomes = deque(maxlen=BREAKER_WINDOW)
+        self.opened_at = None
+        self.half_open = False
+
+    def allow(self):
+        if self.opened_at is None:
+            return True
+        if not self.half_open and time.monotonic() - self.opened_at >= BREAKER_COOLDOWN:
+            # Half-open: let one trial call through; its outcome decides
+            self.half_open = True
+            return True
+        return False
+
+    def record(self, success):
+        if self.half_open:
+            self.half_open = False
+            self.outcomes.clear()
+            if success:
+                logger.info(f"Circuit breaker for {self.name} closed")
+                self.opened_at = None
+            else:
+                self.opened_at = time.monotonic()
+            return
+
+        self.outcomes.append(success)
+        failures = self.outcomes.count(False)
+        if (len(self.outcomes) >= BREAKER_MIN_CALLS
+                and failures / len(self.outcomes) >= BREAKER_ERROR_RATE):
+            logger.warning(f"Circuit breaker for {self.name} opened ({failures}/{len(self.outcomes)} failures)")
+            self.opened_at = time.monotonic()
+
+
+class GuardedTable:
+    """Wraps a DynamoDB Table (or client) so every call goes through the breaker and deadline."""
+
+    def __init__(self, table, name):
+        self.table = table
+        self.name = name
+        self.breaker = CircuitBreaker(name)
+
+    def __getattr__(self, operation):
+        method = getattr(self.table, operation)
+        if not callable(method):
+            return method
+
+        def guarded(*args, **kwargs):
+            if not fits_one_attempt(remaining_ms()):
+                raise TableUnavailableError(f"Not enough time left to call {self.name}.{operation}")
+            if not self.breaker.allow():
+                raise TableUnavailableError(f"{self.name} circuit is open")
+            try:
+                result = method(*args, **kwargs)
+            except ClientError as e:
+                transient = e.response.get('Error', {}).get('Code') in TRANSIENT_ERROR_CODES
+                self.breaker.record(not transient)
+                if transient:
+                    raise TableUnavailableError(f"{self.name}.{operation} failed: {e}") from e
+                raise
+            except BotoCoreError as e:
+                # Connect/read timeouts and endpoint errors
+                self.breaker.record(False)
+                raise TableUnavailableError(f"{self.name}.{operation} failed: {e}") from e
+            except Exception:
+                # Request bugs (e.g. a serializer TypeError) say nothing about the table's
+                # health, but they must still settle a half-open trial call
+                self.breaker.record(True)
+                raise
+            self.breaker.record(True)
+            return result
+
+        return guarded
+
+
+def fits_one_attempt(remaining):
+    margin = min(DEADLINE_MARGIN_MS, remaining * DEADLINE_MARGIN_FRACTION)
+    return remaining - margin >= ATTEMPT_BUDGET_MS
+
+def check_timeout_budget(timeout_ms):
+    """Refuse to start if a fresh invocation could never make a single DynamoDB attempt."""
+    if not fits_one_attempt(timeout_ms):
+        raise RuntimeError(
+            f"Lambda timeout of {timeout_ms} ms cannot fit one DynamoDB attempt "
+            f"({ATTEMPT_BUDGET_MS:.0f} ms) plus the reply margin; raise LAMBDA_TIMEOUT_MS "
+            f"or lower DDB_CONNECT_TIMEOUT/DDB_READ_TIMEOUT"
+        )
+
+# Context, session and tenant of the invocation being handled. Thread-local so that
+# turns replayed concurrently (replay_transcripts.py --concurrency) never see each other's.
+_invocation = threading.local()
+
+def remaining_ms():
+    context = getattr(_invocation, 'context', None)
+    if context is None:
+        return float('inf')
+    return context.get_remaining_time_in_millis()
+
+# -------------------------
+#   TENANTS
+# -------------------------
+class Tenant:
+    """One campus: its own DynamoDB resource, guarded tables and catalog cache, all created on first use."""
+
+    def __init__(self, name, region=None, table_prefix='', **_):
+        self.name = name
+        self.region = region
+        self.table_prefix = table_prefix
+        self._dynamodb = None
+        self._tables = {}
+        self._transactions = None
+        # Last good course catalog: {'items': [...], 'fetched_at': monotonic seconds,
+        # 'stale': True when the counts did not come from a live scan (e.g. a build-time snapshot)}
+        self.catalog_cache = {'items': None, 'fetched_at': 0.0, 'stale': False}
+
+    @property
+    def dynamodb(self):
+        if self._dynamodb is None:
+            logger.info(f"Creating DynamoDB resource for tenant {self.name}")
+            self._dynamodb = boto3.resource('dynamodb', region_name=self.region, config=DYNAMODB_CONFIG)
+        return self._dynamodb
+
+    def _create_table(self, base_name):
+        return self.dynamodb.Table(self.table_prefix + base_name)
+
+    def table(self, base_name):
+        with _tenants_lock:
+            if base_name not in self._tables:
+                self._tables[base_name] = GuardedTable(self._create_table(base_name), f"{self.name}/{base_name}")
+            return self._tables[base_name]
+
+    def _create_client(self):
+        return self.dynamodb.meta.client
+
+    @property
+    def transactions(self):
+        with _tenants_lock:
+            if self._transactions is None:
+                self._transactions = GuardedTable(self._create_client(), f"{self.name}/transactions")
+            return self._transactions
+
+    def transact_write(self, operations, token):
+        """Apply Put/Update/Delete operations on base table names atomically and idempotently.
+
+        The token is sent as ClientRequestToken, so a botocore retry of a request that
+        actually succeeded (e.g. after a read timeout) is not applied twice.
+        """
+        serializer = TypeSerializer()
+        transact_items = []
+        for operation in operations:
+            (action, params), = operation.items()
+            params = dict(params, TableName=self.table_prefix + params['TableName'])
+            for field in ('Item', 'Key', 'ExpressionAttributeValues'):
+                if field in params:
+                    params[field] = {k: serializer.serialize(v) for k, v in params[field].items()}
+            transact_items.append({action: params})
+        return self.transactions.transact_write_items(TransactItems=transact_items, ClientRequestToken=token)
+
+    @property
+    def courses_table(self):
+        return self.table('Courses')
+
+    @property
+    def registrations_table(self):
+        return self.table('Registrations')
+
+    def cache_catalog(self, items, stale=False):
+        size = len(json.dumps(items, default=str))
+        if size > TENANT_CACHE_MAX_BYTES:
+            logger.warning(f"Catalog for tenant {self.name} is {size} bytes (cap {TENANT_CACHE_MAX_BYTES}); not caching")
+            self.catalog_cache = {'items': None, 'fetched_at': 0.0, 'stale': False}
+            return
+        self.catalog_cache = {'items': items, 'fetched_at': time.monotonic(), 'stale': stale}
+
+
+_tenants = {}
+_tenants_lock = threading.RLock()
+
+def get_tenant(name):
+    if name not in TENANTS:
+        raise UnknownTenantError(f"Unknown tenant {name}")
+    with _tenants_lock:
+        if name not in _tenants:
+            _tenants[name] = Tenant(name, **TENANTS[name])
+        return _tenants[name]
+
+def check_tenants():
+    """Refuse to start if requests without a campus would have nowhere to go."""
+    if DEFAULT_TENANT not in TENANTS:
+        raise RuntimeError(f"DEFAULT_TENANT {DEFAULT_TENANT} is not defined in TENANTS ({', '.join(TENANTS)})")
+
+def resolve_tenant(event):
+    """Pick the tenant from the bot alias, then the campus session attribute, then the default."""
+    campus = (event['sessionState'].get('sessionAttributes') or {}).get(TENANT_ATTRIBUTE)
+
+    # The alias is set by the deployment, the session attribute by the client,
+    # so a campus that disagrees with the alias is rejected rather than trusted
+    bot = event.get('bot') or {}
+    for alias in (bot.get('aliasName'), bot.get('aliasId')):
+        for name, config in TENANTS.items():
+            if alias and alias in config.get('aliases', []):
+                if campus and campus != name:
+                    raise UnknownTenantError(f"Campus {campus} does not match bot alias {alias} ({name})")
+                return get_tenant(name)
+
+    if campus:
+        return get_tenant(campus)
+    return get_tenant(DEFAULT_TENANT)
+
+
+def current_tenant():
+    """Resolve the invocation's tenant on first use, so intents without tables never need one."""
+    if getattr(_invocation, 'tenant', None) is None and getattr(_invocation, 'event', None) is not None:
+        _invocation.tenant = resolve_tenant(_invocation.event)
+        logger.info(f"Tenant: {_invocation.tenant.name}")
+    return getattr(_invocation, 'tenant', None)
+
+# -------------------------
+#   WARM-UP
+# -------------------------
+def load_catalog_snapshot(path):
+    """Read ({tenant: [course items]}, generated_at epoch seconds) from a snapshot file, or ({}, 0)."""
+    if not path or not os.path.exists(path):
+        logger.info(f"No catalog snapshot at {path}")
+        return {}, 0
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        snapshot = json.load(f)
+    if not isinstance(snapshot, dict):
+        raise ValueError(f"Snapshot is a {type(snapshot).__name__}, not an object")
+    if snapshot.get('version') != CATALOG_SNAPSHOT_VERSION:
+        logger.warning(f"Ignoring catalog snapshot with version {snapshot.get('version')}")
+        return {}, 0
+
+    tenants, generated_at = snapshot.get('tenants'), snapshot.get('generated_at')
+    if isinstance(generated_at, bool) or not isinstance(generated_at, (int, float)):
+        raise ValueError(f"Snapshot generated_at {generated_at!r} is not a timestamp")
+    if not isinstance(tenants, dict):
+        raise ValueError("Snapshot tenants is not an object")
+    for name, items in tenants.items():
+        if not isinstance(items, list) or not all(isinstance(i, dict) and 'course_id' in i for i in items):
+            raise ValueError(f"Snapshot catalog for {name} is not a list of courses")
+    return tenants, generated_at
+
+def warm_up():
+    """Create clients and preload catalogs so the first turn on a new container is cheap."""
+    started = time.monotonic()
+    try:
+        catalogs, generated_at = load_catalog_snapshot(CATALOG_SNAPSHOT)
+    except Exception as e:
+        # A bad snapshot must never stop the container from starting; scans still work
+        logger.warning(f"Could not read catalog snapshot: {str(e)}")
+        catalogs, generated_at = {}, 0
+    # Enrollment counts are from build time; only treat them as current if the snapshot is that recent
+    snapshot_stale = time.time() - generated_at > CATALOG_CACHE_TTL
+
+    warmed = []
+    for name in dict.fromkeys([DEFAULT_TENANT, *catalogs]):
+        if name not in TENANTS:
+            continue
+        tenant = get_tenant(name)
+        # Building the resource loads botocore's service model, the slow part of cold starts
+        tenant.dynamodb
+        if name in catalogs:
+            tenant.cache_catalog(catalogs[name], stale=snapshot_stale)
+        warmed.append(name)
+
+    logger.info(f"Warm-up done in {(time.monotonic() - started) * 1000:.0f} ms for tenants {warmed}")
+    return warmed
+
+def is_warm_ping(event):
+    return bool(event.get(WARM_PING_KEY)) or event.get('source') == 'aws.events'
+
+# -------------------------
+#   SESSION STATE
+# -------------------------
+def encode_session_fields(fields):
+    """Pack typed fields into one compact, versioned string."""
+    payload = json.dumps(fields, separators=(',', ':')).encode('utf-8')
+    compressed = zlib.compress(payload, 9)
+    # Tiny payloads grow under zlib, so only keep the compressed form when it wins
+    if len(compressed) < len(payload):
+        return f"{SESSION_SCHEMA_VERSION}z." + base64.urlsafe_b64encode(compressed).decode('ascii')
+    return f"{SESSION_SCHEMA_VERSION}j." + base64.urlsafe_b64encode(payload).decode('ascii')
+
+def decode_session_fields(blob):
+    # Layout: <schema version><codec>.<base64 body>, codec 'z' = zlib JSON, 'j' = plain JSON
+    header, _, body = blob.partition('.')
+    version, codec = header[:-1], header[-1:]
+    if version != str(SESSION_SCHEMA_VERSION):
+        logger.warning(f"Discarding session state with schema version {version}")
+        return {}
+    try:
+        payload = base64.urlsafe_b64decode(body)
+        if codec == 'z':
+            payload = zlib.decompress(payload)
+        return json.loads(payload)
+    except (ValueError, zlib.error) as e:
+        logger.warning(f"Discarding unreadable session state: {str(e)}")
+        return {}
+
+
+class SessionState:
+    """Plain sessionAttributes plus typed fields that are only decoded when touched."""
+
+    def __init__(self, attributes):
+        self.attributes = dict(attributes or {})
+        self.blob = self.attributes.pop(SESSION_STATE_KEY, None)
+        self.fields = None
+        self.dirty = False
+
+    def _decoded(self):
+        if self.fields is None:
+            self.fields = decode_session_fields(self.blob) if self.blob else {}
+        return self.fields
+
+    def get(self, name, default=None):
+        key, _, _ = SESSION_SCHEMA[name]
+        return self._decoded().get(key, default)
+
+    def set(self, name, value):
+        key, field_type, max_length = SESSION_SCHEMA[name]
+        fields = self._decoded()
+        if value is None:
+            fields.pop(key, None)
+        elif not isinstance(value, field_type):
+            raise TypeError(f"Session field {name} expects {field_type.__name__}, got {type(value).__name__}")
+        elif len(json.dumps(value, separators=(',', ':'))) > max_length:
+            raise ValueError(f"Session field {name} is longer than {max_length} characters of JSON")
+        else:
+            fields[key] = value
+        self.dirty = True
+
+    def encode(self):
+        attributes = dict(self.attributes)
+        if self.dirty:
+            self.blob = encode_session_fields(self.fields) if self.fields else None
+            self.dirty = False
+        if self.blob:
+            attributes[SESSION_STATE_KEY] = self.blob
+
+        size = len(json.dumps(attributes, separators=(',', ':'), ensure_ascii=False).encode('utf-8'))
+        if size > SESSION_SIZE_BUDGET and SESSION_STATE_KEY in attributes:
+            # Packed state only holds what handlers can rebuild, so it goes first
+            logger.error(f"Session attributes are {size} bytes (budget {SESSION_SIZE_BUDGET}); dropping packed state")
+            del attributes[SESSION_STATE_KEY]
+            size = len(json.dumps(attributes, separators=(',', ':'), ensure_ascii=False).encode('utf-8'))
+        if size > SESSION_SIZE_BUDGET:
+            # Nothing left to drop: the identity attributes come from the frontend
+            logger.error(f"Plain session attributes alone are {size} bytes (budget {SESSION_SIZE_BUDGET})")
+        return attributes
+
+
+def current_session():
+    return getattr(_invocation, 'session', None)
 
 # -------------------------
 #   MAIN ROUTER
 # -------------------------
 def lambda_handler(event, context):
-    logger.info(f"Lambda handler invoked with event: {json.dumps(event)}")
+    if is_warm_ping(event):
+        logger.info("Warm ping received")
+        return {'warm': True, 'tenants': sorted(_tenants)}
+
+    if not CAPTURE_TRANSCRIPTS:
+        # While capturing, the sanitized TRANSCRIPT line stands in for the raw event
+        logger.info(f"Lambda handler invoked with event: {json.dumps(event)}")
     intent = event['sessionState']['intent']['name']
     logger.info(f"Processing intent: {intent}")
 
+    started = time.monotonic()
+    _invocation.context = context
+    _invocation.session = SessionState(event['sessionState'].get('sessionAttributes'))
+    _invocation.event = event
+    _invocation.tenant = None
+    try:
+        response = route_intent(event, intent)
+    except UnknownTenantError as e:
+        logger.error(str(e))
+        response = close_intent(event, 'Failed', UNKNOWN_CAMPUS_MESSAGE)
+    except TableUnavailableError as e:
+        logger.error(f"DynamoDB unavailable: {str(e)}")
+        response = close_intent(event, 'Failed', TRY_AGAIN_MESSAGE)
+    finally:
+        _invocation.context = None
+        _invocation.session = None
+        _invocation.event = None
+        _invocation.tenant = None
+
+    if CAPTURE_TRANSCRIPTS:
+        capture_transcript(event, response, (time.monotonic() - started) * 1000)
+    return response
+
+def route_intent(event, intent):
     if intent == 'RegisterCourseIntent':
         return handle_register_course(event)
 
@@ -49,8 +549,7 @@ def lambda_handler(event, context):
 # -------------------------
 def handle_available_courses(event):
     logger.info("Handling GetAvailableCoursesIntent")
-    response = courses_table.scan()
-    items = response.get('Items', [])
+    items, stale = get_course_catalog(current_tenant())
     logger.info(f"Found {len(items)} available courses")
 
     if not items:
@@ -67,13 +566,34 @@ def handle_available_courses(event):
         message += f"  Schedule: {c.get('schedule', 'TBA')}\n"
         message += f"  Capacity: {c.get('enrolled_count', 0)}/{c.get('capacity', 0)}\n\n"
 
+    if stale:
+        message += "ℹ️ Enrollment numbers may be out of date."
+
     return close_intent(event, 'Fulfilled', message)
 
+def get_course_catalog(tenant):
+    """Return (items, stale), preferring a recent scan and falling back to the last good one."""
+    cached = tenant.catalog_cache['items']
+    if cached is not None and time.monotonic() - tenant.catalog_cache['fetched_at'] < CATALOG_CACHE_TTL:
+        return cached, tenant.catalog_cache['stale']
+
+    try:
+        items = tenant.courses_table.scan().get('Items', [])
+    except TableUnavailableError as e:
+        if cached is None:
+            raise
+        logger.warning(f"Serving cached course catalog: {str(e)}")
+        return cached, True
+
+    tenant.cache_catalog(items)
+    return items, False
+
 # -------------------------
 #   REGISTER COURSE
 # -------------------------
 def handle_register_course(event):
     logger.info("Handling RegisterCourseIntent")
+    tenant = current_tenant()
     session_attributes = event['sessionState'].get('sessionAttributes', {})
     student_id = session_attributes.get('student_id')
     student_name = session_attributes.get('name', 'Student')
@@ -93,7 +613,7 @@ def handle_register_course(event):
     logger.info(f"Attempting to register student {student_id} for course {course_id}")
 
     try:
-        course_response = courses_table.get_item(Key={'course_id': course_id})
+        course_response = tenant.courses_table.get_item(Key={'course_id': course_id})
         if 'Item' not in course_response:
             logger.warning(f"Course {course_id} not found in database")
             return close_intent(event, 'Failed', f"Course {course_id} does not exist.")
@@ -105,7 +625,7 @@ def handle_register_course(event):
             logger.warning(f"Course {course_id} is full")
             return close_intent(event, 'Failed', f"{course['course_name']} is full.")
 
-        existing = registrations_table.query(
+        existing = tenant.registrations_table.query(
             IndexName='student-index',
             KeyConditionExpression='student_id = :sid',
             ExpressionAttributeValues={':sid': student_id}
@@ -115,24 +635,38 @@ def handle_register_course(event):
             logger.warning(f"Student {student_id} already registered for {course_id}")
             return close_intent(event, 'Failed', f"You are already registered for {course['course_name']}.")
 
-        # Register student
+        # Register student and increase the enrollment count in one transaction
         registration_id = str(uuid.uuid4())
         logger.info(f"Creating registration {registration_id} for student {student_id}, course {course_id}")
-        registrations_table.put_item(Item={
-            'registration_id': registration_id,
-            'student_id': student_id,
-            'course_id': course_id,
-            'status': 'enrolled',
-            'registration_date': datetime.now().strftime('%Y-%m-%d')
-        })
-
-        # Increase enrollment count
-        courses_table.update_item(
-            Key={'course_id': course_id},
-            UpdateExpression='SET enrolled_count = enrolled_count + :v',
-            ExpressionAttributeValues={':v': 1}
-        )
-        
+        try:
+            tenant.transact_write([
+                {'Put': {
+                    'TableName': 'Registrations',
+                    'Item': {
+                        'registration_id': registration_id,
+                        'student_id': student_id,
+                        'course_id': course_id,
+                        'status': 'enrolled',
+                        'registration_date': datetime.now().strftime('%Y-%m-%d')
+                    },
+                    'ConditionExpression': 'attribute_not_exists(registration_id)'
+                }},
+                {'Update': {
+                    'TableName': 'Courses',
+                    'Key': {'course_id': course_id},
+                    'UpdateExpression': 'SET enrolled_count = enrolled_count + :v',
+                    # CAPACITY is a DynamoDB reserved word
+                    'ConditionExpression': 'attribute_exists(course_id) AND enrolled_count < #capacity',
+                    'ExpressionAttributeNames': {'#capacity': 'capacity'},
+                    'ExpressionAttributeValues': {':v': 1}
+                }}
+            ], token=f"reg-{uuid.UUID(registration_id).hex}")
+        except ClientError as e:
+            if not is_failed_condition(e):
+                raise
+            logger.warning(f"Course {course_id} filled up before registration {registration_id}")
+            return close_intent(event, 'Failed', f"{course['course_name']} is full.")
+
         logger.info(f"Successfully registered student {student_id} for course {course_id}")
 
         success = (
@@ -145,6 +679,8 @@ def handle_register_course(event):
         )
         return close_intent(event, 'Fulfilled', success)
 
+    except TableUnavailableError:
+        raise
     except Exception as e:
         logger.error(f"Error during registration: {str(e)}", exc_info=True)
         return close_intent(event, 'Failed', "Something went wrong while registering.")
@@ -154,6 +690,7 @@ def handle_register_course(event):
 # -------------------------
 def handle_view_courses(event):
     logger.info("Handling ViewRegisteredCoursesIntent")
+    tenant = current_tenant()
     session_attributes = event['sessionState'].get('sessionAttributes', {})
     student_id = session_attributes.get('student_id')
     student_name = session_attributes.get('name', 'Student')
@@ -163,7 +700,7 @@ def handle_view_courses(event):
         logger.error("Missing student_id in session attributes")
         return close_intent(event, "Failed", "I couldn’t verify your student identity.")
 
-    registration_list = registrations_table.query(
+    registration_list = tenant.registrations_table.query(
         IndexName='student-index',
         KeyConditionExpression='student_id = :sid',
         ExpressionAttributeValues={':sid': student_id}
@@ -176,7 +713,7 @@ def handle_view_courses(event):
 
     msg = f"Here are your registered courses, {student_name}:\n\n"
     for reg in registration_list:
-        course = courses_table.get_item(Key={'course_id': reg['course_id']}).get('Item', {})
+        course = tenant.courses_table.get_item(Key={'course_id': reg['course_id']}).get('Item', {})
         msg += f"- {course.get('course_name', reg['course_id'])} ({reg['course_id']})\n"
         msg += f"  Schedule: {course.get('schedule', 'TBA')}\n"
         msg += f"  Room: {course.get('room', 'TBA')}\n\n"
@@ -188,6 +725,7 @@ def handle_view_courses(event):
 # -------------------------
 def handle_unregister_course(event):
     logger.info("Handling UnregisterCourseIntent")
+    tenant = current_tenant()
     session_attributes = event['sessionState'].get('sessionAttributes', {})
     student_id = session_attributes.get('student_id')
     if not student_id:
@@ -202,7 +740,7 @@ def handle_unregister_course(event):
     course_id = course_slot['value']['interpretedValue']
     logger.info(f"Attempting to unregister student {student_id} from course {course_id}")
 
-    regs = registrations_table.query(
+    regs = tenant.registrations_table.query(
         IndexName='student-index',
         KeyConditionExpression='student_id = :sid',
         ExpressionAttributeValues={':sid': student_id}
@@ -213,15 +751,28 @@ def handle_unregister_course(event):
         logger.warning(f"Student {student_id} not registered for course {course_id}")
         return close_intent(event, 'Failed', f"You are not registered for {course_id}.")
 
+    # Delete the registration and decrease the enrollment count in one transaction
     logger.info(f"Deleting registration {reg_obj['registration_id']}")
-    registrations_table.delete_item(Key={'registration_id': reg_obj['registration_id']})
+    try:
+        tenant.transact_write([
+            {'Delete': {
+                'TableName': 'Registrations',
+                'Key': {'registration_id': reg_obj['registration_id']},
+                'ConditionExpression': 'attribute_exists(registration_id)'
+            }},
+            {'Update': {
+                'TableName': 'Courses',
+                'Key': {'course_id': course_id},
+                'UpdateExpression': 'SET enrolled_count = enrolled_count - :v',
+                'ExpressionAttributeValues': {':v': 1}
+            }}
+        ], token=f"drop-{hashlib.sha256(reg_obj['registration_id'].encode('utf-8')).hexdigest()[:31]}")
+    except ClientError as e:
+        if not is_failed_condition(e):
+            raise
+        logger.warning(f"Registration {reg_obj['registration_id']} was already removed")
+        return close_intent(event, 'Failed', f"You are not registered for {course_id}.")
 
-    courses_table.update_item(
-        Key={'course_id': course_id},
-        UpdateExpression='SET enrolled_count = enrolled_count - :v',
-        ExpressionAttributeValues={':v': 1}
-    )
-    
     logger.info(f"Successfully unregistered student {student_id} from course {course_id}")
 
     return close_intent(event, 'Fulfilled', f"✔ You have successfully dropped {course_id}.")
@@ -267,16 +818,92 @@ def close_intent(event, state, message):
                 'name': event['sessionState']['intent']['name'],
                 'state': state
             },
-            'sessionAttributes': event['sessionState'].get('sessionAttributes', {})
+            'sessionAttributes': session_attributes_for(event)
         },
         'messages': [{'contentType': 'PlainText', 'content': message}]
     }
 
+def is_failed_condition(error):
+    """True for a cancelled transaction whose conditions failed; transient cancellations raise."""
+    if error.response.get('Error', {}).get('Code') != 'TransactionCanceledException':
+        return False
+    codes = {r.get('Code') for r in error.response.get('CancellationReasons', [])}
+    if codes & TRANSIENT_CANCELLATION_CODES:
+        raise TableUnavailableError(f"Transaction cancelled: {sorted(codes)}") from error
+    return 'ConditionalCheckFailed' in codes
+
+def session_attributes_for(event):
+    session = current_session()
+    if session is None:
+        return event['sessionState'].get('sessionAttributes', {})
+    return session.encode()
+
+def pseudonymize(value):
+    digest = hmac.new(CAPTURE_HMAC_KEY, str(value).encode('utf-8'), hashlib.sha256).hexdigest()[:16]
+    return f"anon-{digest}"
+
+def replace_whole_words(text, mapping):
+    for value, pseudonym in mapping.items():
+        text = re.sub(rf'(?<!\w){re.escape(value)}(?!\w)', pseudonym, text)
+    return text
+
+def redact_free_text(value):
+    if isinstance(value, dict):
+        for key, item in value.items():
+            if key in FREE_TEXT_FIELDS and isinstance(item, str):
+                value[key] = REDACTED
+            else:
+                redact_free_text(item)
+    elif isinstance(value, list):
+        for item in value:
+            redact_free_text(item)
+
+def capture_transcript(event, response, duration_ms):
+    """Log one replayable JSON line with student details replaced by stable pseudonyms."""
+    # Work on copies; the originals are still being returned to Lex
+    event = json.loads(json.dumps(event, default=str))
+    response = json.loads(json.dumps(response, default=str))
+
+    # Same input always maps to the same pseudonym, so a student's turns still line up
+    mapping = {}
+    for attributes in (event['sessionState'].get('sessionAttributes'),
+                       response.get('sessionState', {}).get('sessionAttributes')):
+        for key in SENSITIVE_ATTRIBUTES:
+            if attributes and attributes.get(key):
+                value = str(attributes[key])
+                mapping[value] = pseudonymize(value)
+                attributes[key] = mapping[value]
+    if event.get('sessionId'):
+        event['sessionId'] = pseudonymize(event['sessionId'])
+
+    # Utterances, ASR transcriptions and slot originalValues are dropped; replay
+    # only needs the interpreted values. Bot messages quote the values above, so
+    # those get whole-word pseudonyms to stay comparable between runs.
+    redact_free_text(event)
+    for message in response.get('messages', []):
+        if message.get('content'):
+            message['content'] = replace_whole_words(message['content'], mapping)
+
+    record = json.dumps({
+        'timestamp': time.time(),
+        'intent': event['sessionState']['intent']['name'],
+        'duration_ms': round(duration_ms, 2),
+        'event': event,
+        'response': response
+    }, ensure_ascii=False)
+    logger.info(TRANSCRIPT_MARKER + record)
+
 def elicit_slot(event, slot, message):
     return {
         'sessionState': {
             'dialogAction': {'type': 'ElicitSlot', 'slotToElicit': slot},
-            'intent': event['sessionState']['intent']
+            'intent': event['sessionState']['intent'],
+            'sessionAttributes': session_attributes_for(event)
         },
         'messages': [{'contentType': 'PlainText', 'content': message}]
     }
+
+# Runs once per container, during the Lambda init phase (before any request)
+check_timeout_budget(LAMBDA_TIMEOUT_MS)
+check_tenants()
+warm_up()
@@ -0,0 +1,417 @@
+"""
+Replay captured Lex V2 transcripts against lambda_function.py locally.
+
+Capture: set CAPTURE_TRANSCRIPTS=true on the Lambda, then export the
+"TRANSCRIPT {...}" lines from CloudWatch Logs into a file.
+
+Replay:
+    python replay_transcripts.py transcripts.log --seed seed.json \\
+        --concurrency 8 --speedup 10 --profile-dir profiles --output run.jsonl
+
+Compare two code versions:
+    python replay_transcripts.py transcripts.log --handler old/lambda_function.py --output old.jsonl
+    python replay_transcripts.py transcripts.log --compare old.jsonl
+
+The .prof files written per intent open in snakeviz or flameprof for a
+flame graph, or with `python -m pstats`.
+"""
+import argparse
+import cProfile
+import difflib
+import importlib.util
+import json
+import os
+import pstats
+import random
+import re
+import sys
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from boto3.dynamodb.types import TypeDeserializer
+from botocore.exceptions import ClientError
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+TRANSCRIPT_MARKER = 'TRANSCRIPT '
+
+# Primary key and GSIs of each table (see create_dynamodb_tables.py)
+TABLE_KEYS = {'Courses': 'course_id', 'Registrations': 'registration_id'}
+INDEX_KEYS = {'student-index': 'student_id', 'course-index': 'course_id'}
+
+UPDATE_PATTERN = re.compile(r'SET (\w+) = \1 ([+-]) (:\w+)')
+EXISTS_PATTERN = re.compile(r'attribute_(not_)?exists\((\w+)\)')
+COMPARE_PATTERN = re.compile(r'([#:]?\w+) (<|<=|>|>=|=) ([#:]?\w+)')
+COMPARISONS = {
+    '<': lambda a, b: a < b, '<=': lambda a, b: a <= b,
+    '>': lambda a, b: a > b, '>=': lambda a, b: a >= b, '=': lambda a, b: a == b,
+}
+
+
+# ============================================
+# LOCAL TABLE STAND-IN
+# ============================================
+
+class LocalTable:
+    """In-memory stand-in for the few DynamoDB Table calls the Lambda makes."""
+
+    def __init__(self, name, items=(), latency_ms=0, throttle_rate=0.0):
+        self.name = name
+        self.key = TABLE_KEYS[name]
+        self.items = {item[self.key]: dict(item) for item in items}
+        self.latency_ms = latency_ms
+        self.throttle_rate = throttle_rate
+        self.lock = threading.Lock()
+
+    def _simulate(self, operation):
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+        if self.throttle_rate and random.random() < self.throttle_rate:
+            raise ClientError(
+                {'Error': {'Code': 'ProvisionedThroughputExceededException', 'Message': 'Injected throttle'}},
+                operation
+            )
+
+    def scan(self, **kwargs):
+        self._simulate('Scan')
+        with self.lock:
+            return {'Items': [dict(i) for i in self.items.values()]}
+
+    def get_item(self, Key, **kwargs):
+        self._simulate('GetItem')
+        with self.lock:
+            item = self.items.get(Key[self.key])
+            return {'Item': dict(item)} if item else {}
+
+    def query(self, IndexName, ExpressionAttributeValues, **kwargs):
+        self._simulate('Query')
+        attribute = INDEX_KEYS[IndexName]
+        value = next(iter(ExpressionAttributeValues.values()))
+        with self.lock:
+            return {'Items': [dict(i) for i in self.items.values() if i.get(attribute) == value]}
+
+    def put_item(self, Item, **kwargs):
+        self._simulate('PutItem')
+        with self.lock:
+            self.items[Item[self.key]] = dict(Item)
+        return {}
+
+    def update_item(self, Key, UpdateExpression, ExpressionAttributeValues, **kwargs):
+        self._simulate('UpdateItem')
+        attribute, sign, placeholder = UPDATE_PATTERN.match(UpdateExpression).groups()
+        delta = ExpressionAttributeValues[placeholder]
+        with self.lock:
+            item = self.items.setdefault(Key[self.key], dict(Key))
+            item[attribute] = item.get(attribute, 0) + (delta if sign == '+' else -delta)
+        return {}
+
+    def delete_item(self, Key, **kwargs):
+        self._simulate('DeleteItem')
+        with self.lock:
+            self.items.pop(Key[self.key], None)
+        return {}
+
+
+class LocalClient:
+    """Stand-in for the DynamoDB client's transact_write_items over LocalTables.
+
+    Supports the condition expressions the Lambda uses (attribute_exists,
+    attribute_not_exists and simple comparisons joined by AND) and honours
+    ClientRequestToken the way DynamoDB does, applying a repeated token once.
+    """
+
+    def __init__(self, resolve_table):
+        self.resolve_table = resolve_table
+        self.tokens = set()
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def _condition_holds(expression, item, names, values):
+        def operand(token):
+            if token.startswith(':'):
+                return values[token]
+            return (item or {}).get(names.get(token, token))
+
+        for clause in expression.split(' AND '):
+            clause = clause.strip()
+            exists = EXISTS_PATTERN.fullmatch(clause)
+            if exists:
+                present = item is not None and names.get(exists.group(2), exists.group(2)) in item
+                if present == bool(exists.group(1)):
+                    return False
+                continue
+            left, op, right = COMPARE_PATTERN.fullmatch(clause).groups()
+            a, b = operand(left), operand(right)
+            if a is None or b is None or not COMPARISONS[op](a, b):
+                return False
+        return True
+
+    def transact_write_items(self, TransactItems, ClientRequestToken=None, **kwargs):
+        deserializer = TypeDeserializer()
+        operations = []
+        for entry in TransactItems:
+            (action, params), = entry.items()
+            params = dict(params)
+            for field in ('Item', 'Key', 'ExpressionAttributeValues'):
+                if field in params:
+                    params[field] = {k: deserializer.deserialize(v) for k, v in params[field].items()}
+            operations.append((action, params, self.resolve_table(params['TableName'])))
+
+        operations[0][2]._simulate('TransactWriteItems')
+        tables = sorted({id(t): t for _, _, t in operations}.values(), key=lambda t: t.name)
+        with self.lock:
+            if ClientRequestToken and ClientRequestToken in self.tokens:
+                return {}
+            for table in tables:
+                table.lock.acquire()
+            try:
+                reasons = []
+                for action, params, table in operations:
+                    key = params['Item'][table.key] if action == 'Put' else params['Key'][table.key]
+                    condition = params.get('ConditionExpression')
+                    holds = not condition or self._condition_holds(
+                        condition, table.items.get(key),
+                        params.get('ExpressionAttributeNames', {}), params.get('ExpressionAttributeValues', {})
+                    )
+                    reasons.append({'Code': 'None' if holds else 'ConditionalCheckFailed'})
+                if any(r['Code'] != 'None' for r in reasons):
+                    raise ClientError(
+                        {'Error': {'Code': 'TransactionCanceledException', 'Message': 'Condition failed'},
+                         'CancellationReasons': reasons},
+                        'TransactWriteItems'
+                    )
+
+                for action, params, table in operations:
+                    if action == 'Put':
+                        table.items[params['Item'][table.key]] = dict(params['Item'])
+                    elif action == 'Delete':
+                        table.items.pop(params['Key'][table.key], None)
+                    elif action == 'Update':
+                        attribute, sign, placeholder = UPDATE_PATTERN.match(params['UpdateExpression']).groups()
+                        delta = params['ExpressionAttributeValues'][placeholder]
+                        item = table.items.setdefault(params['Key'][table.key], dict(params['Key']))
+                        item[attribute] = item.get(attribute, 0) + (delta if sign == '+' else -delta)
+            finally:
+                for table in tables:
+                    table.lock.release()
+            if ClientRequestToken:
+                self.tokens.add(ClientRequestToken)
+        return {}
+
+
+class LambdaContext:
+    """Just enough of the Lambda context object for deadline checks."""
+
+    def __init__(self, timeout_ms):
+        self.deadline = time.monotonic() + timeout_ms / 1000
+
+    def get_remaining_time_in_millis(self):
+        return int((self.deadline - time.monotonic()) * 1000)
+
+
+# ============================================
+# LOADING
+# ============================================
+
+def read_transcripts(path):
+    records = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if TRANSCRIPT_MARKER in line:
+                line = line.split(TRANSCRIPT_MARKER, 1)[1]
+            line = line.strip()
+            if not line.startswith('{'):
+                continue
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue
+    records.sort(key=lambda r: r.get('timestamp', 0))
+    return records
+
+
+def load_handler(path, make_table):
+    os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+    os.environ['CAPTURE_TRANSCRIPTS'] = 'false'
+    spec = importlib.util.spec_from_file_location(f"replayed_lambda_{abs(hash(path))}", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+
+    if hasattr(module, 'Tenant'):
+        # Every tenant gets its own stand-in tables, created when first touched.
+        # Drop tenants built by the init warm-up so the seed, not a snapshot, is served.
+        module.Tenant._create_table = lambda tenant, base_name: make_table(base_name)
+        module.Tenant._create_client = lambda tenant: LocalClient(
+            lambda table_name: tenant.table(table_name[len(tenant.table_prefix):]).table
+        )
+        getattr(module, '_tenants', {}).clear()
+        return module
+
+    # Older single-tenant versions read module-level tables
+    wrap = getattr(module, 'GuardedTable', lambda table, name: table)
+    module.courses_table = wrap(make_table('Courses'), 'Courses')
+    module.registrations_table = wrap(make_table('Registrations'), 'Registrations')
+    return module
+
+
+# ============================================
+# REPLAY
+# ============================================
+
+def replay(module, records, args):
+    results = [None] * len(records)
+    profiles = defaultdict(list)
+    profiles_lock = threading.Lock()
+
+    def run(index, record):
+        event = record['event']
+        intent = event['sessionState']['intent']['name']
+        context = LambdaContext(args.timeout_ms)
+        profiler = cProfile.Profile() if args.profile_dir else None
+
+        started = time.perf_counter()
+        if profiler:
+            profiler.enable()
+        try:
+            response = module.lambda_handler(event, context)
+        except Exception as e:
+            response = {'error': f"{type(e).__name__}: {e}"}
+        finally:
+            if profiler:
+                profiler.disable()
+        duration_ms = (time.perf_counter() - started) * 1000
+
+        if profiler:
+            with profiles_lock:
+                profiles[intent].append(profiler)
+        results[index] = {'index': index, 'intent': intent, 'duration_ms': round(duration_ms, 2), 'response': response}
+
+    start_wall = time.monotonic()
+    first_ts = records[0].get('timestamp', 0) if records else 0
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        for index, record in enumerate(records):
+            if args.speedup > 0:
+                due = (record.get('timestamp', first_ts) - first_ts) / args.speedup
+                delay = due - (time.monotonic() - start_wall)
+                if delay > 0:
+                    time.sleep(delay)
+            pool.submit(run, index, record)
+
+    return results, profiles
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def session_size(response):
+    attributes = response.get('sessionState', {}).get('sessionAttributes') or {}
+    return len(json.dumps(attributes, separators=(',', ':'), ensure_ascii=False).encode('utf-8'))
+
+
+def print_summary(results, session_budget=None):
+    by_intent = defaultdict(list)
+    session_bytes = defaultdict(int)
+    for r in results:
+        by_intent[r['intent']].append(r['duration_ms'])
+        session_bytes[r['intent']] = max(session_bytes[r['intent']], session_size(r['response']))
+
+    print(f"\n⏱️  {len(results)} turns replayed\n")
+    print(f"   {'intent':<32}{'count':>6}{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}{'session B':>11}")
+    for intent, durations in sorted(by_intent.items()):
+        over = " ⚠️" if session_budget and session_bytes[intent] > session_budget else ""
+        print(f"   {intent:<32}{len(durations):>6}{percentile(durations, 50):>10.1f}"
+              f"{percentile(durations, 95):>10.1f}{max(durations):>10.1f}{session_bytes[intent]:>11}{over}")
+
+
+def write_profiles(profiles, directory, top):
+    os.makedirs(directory, exist_ok=True)
+    for intent, profilers in sorted(profiles.items()):
+        stats = pstats.Stats(profilers[0])
+        for profiler in profilers[1:]:
+            stats.add(profiler)
+        path = os.path.join(directory, f"{intent}.prof")
+        stats.dump_stats(path)
+        print(f"\n📈 {intent} ({len(profilers)} calls) → {path}")
+        stats.sort_stats('cumulative').print_stats(top)
+
+
+def diff_responses(results, baseline_path):
+    # Previous --output files and transcripts both carry a 'response' per turn
+    baseline = read_transcripts(baseline_path)
+
+    changed = 0
+    for index, result in enumerate(results):
+        if index >= len(baseline):
+            break
+        before = json.dumps(baseline[index].get('response'), indent=2, sort_keys=True, ensure_ascii=False)
+        after = json.dumps(result['response'], indent=2, sort_keys=True, ensure_ascii=False)
+        if before != after:
+            changed += 1
+            print(f"\n🔀 Turn {index} ({result['intent']}) differs:")
+            sys.stdout.writelines(difflib.unified_diff(
+                before.splitlines(True), after.splitlines(True), 'baseline', 'replay'
+            ))
+            print()
+    if len(baseline) != len(results):
+        print(f"⚠️  Baseline has {len(baseline)} turns, replay has {len(results)}")
+    print(f"\n🔍 {changed}/{min(len(results), len(baseline))} responses differ from {baseline_path}")
+    return changed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('transcripts', help="JSONL file or CloudWatch export with TRANSCRIPT lines")
+    parser.add_argument('--handler', default=os.path.join(SCRIPT_DIR, 'lambda_function.py'),
+                        help="lambda_function.py to replay against")
+    parser.add_argument('--seed', help="JSON file of {\"Courses\": [...], \"Registrations\": [...]}, copied into every tenant")
+    parser.add_argument('--concurrency', type=int, default=1)
+    parser.add_argument('--speedup', type=float, default=0,
+                        help="Replay N times faster than recorded (0 = as fast as possible)")
+    parser.add_argument('--latency-ms', type=float, default=0, help="Injected latency per table call")
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help="Fraction of table calls throttled")
+    parser.add_argument('--timeout-ms', type=int, default=30000, help="Simulated Lambda budget per turn")
+    parser.add_argument('--profile-dir', help="Write per-intent cProfile output here")
+    parser.add_argument('--top', type=int, default=15, help="Functions shown per intent profile")
+    parser.add_argument('--output', help="Write replayed responses as JSONL")
+    parser.add_argument('--compare', help="Diff responses against a previous --output or a transcript file")
+    args = parser.parse_args()
+
+    if args.profile_dir and args.concurrency > 1 and sys.version_info >= (3, 12):
+        # cProfile can only have one active profiler per process from 3.12 on
+        parser.error("--profile-dir needs --concurrency 1 on Python 3.12+")
+
+    seed = {}
+    if args.seed:
+        with open(args.seed, encoding='utf-8') as f:
+            seed = json.load(f)
+
+    def make_table(name):
+        return LocalTable(name, seed.get(name, []), args.latency_ms, args.throttle_rate)
+
+    records = read_transcripts(args.transcripts)
+    if not records:
+        sys.exit(f"❌ No transcripts found in {args.transcripts}")
+    print(f"▶️  Replaying {len(records)} turns against {args.handler}")
+
+    module = load_handler(args.handler, make_table)
+    results, profiles = replay(module, records, args)
+    print_summary(results, getattr(module, 'SESSION_SIZE_BUDGET', None))
+
+    if args.profile_dir:
+        write_profiles(profiles, args.profile_dir, args.top)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            for result in results:
+                f.write(json.dumps(result, default=str, ensure_ascii=False) + '\n')
+        print(f"\n💾 Responses written to {args.output}")
+
+    if args.compare:
+        diff_responses(results, args.compare)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+import json
+import logging
+import os
+
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+
+import pytest
+
+import lambda_function as lf
+
+ATTRIBUTES = {
+    'cognito_username': 'ajohnson',
+    'email': 'alice.johnson@school.edu',
+    'name': 'Alice',
+    'student_id': 'S1001',
+}
+
+
+@pytest.fixture
+def capture(monkeypatch, caplog):
+    monkeypatch.setattr(lf, 'CAPTURE_TRANSCRIPTS', True)
+    monkeypatch.setattr(lf, 'CAPTURE_HMAC_KEY', b'test-key')
+    caplog.set_level(logging.INFO)
+    return caplog
+
+
+def captured(caplog):
+    lines = [r.getMessage() for r in caplog.records]
+    return [json.loads(line[len(lf.TRANSCRIPT_MARKER):]) for line in lines if line.startswith(lf.TRANSCRIPT_MARKER)]
+
+
+def library_hours_event():
+    return {
+        'sessionId': 'S1001',
+        'inputTranscript': 'hi this is Alice, my phone is 555 0100',
+        'transcriptions': [{'transcription': 'hi this is Alice', 'transcriptionConfidence': 0.9}],
+        'interpretations': [{'intent': {'name': 'LibraryHoursIntent', 'slots': {
+            'Day': {'value': {'originalValue': 'tomorow', 'interpretedValue': 'tomorrow', 'resolvedValues': []}}
+        }}}],
+        'sessionState': {
+            'intent': {'name': 'LibraryHoursIntent', 'slots': {}},
+            'sessionAttributes': dict(ATTRIBUTES)
+        }
+    }
+
+
+def test_capture_removes_identity_and_free_text(capture):
+    lf.lambda_handler(library_hours_event(), None)
+
+    [record] = captured(capture)
+    logged = '\n'.join(r.getMessage() for r in capture.records)
+    for value in list(ATTRIBUTES.values()) + ['555 0100', 'tomorow']:
+        assert value not in logged
+
+    event = record['event']
+    assert event['inputTranscript'] == lf.REDACTED
+    assert event['transcriptions'][0]['transcription'] == lf.REDACTED
+    day = event['interpretations'][0]['intent']['slots']['Day']['value']
+    assert day == {'originalValue': lf.REDACTED, 'interpretedValue': 'tomorrow', 'resolvedValues': []}
+    assert event['sessionId'] == event['sessionState']['sessionAttributes']['student_id']
+
+
+def test_pseudonyms_depend_on_the_key(monkeypatch):
+    monkeypatch.setattr(lf, 'CAPTURE_HMAC_KEY', b'one')
+    first = lf.pseudonymize('S1001')
+    assert lf.pseudonymize('S1001') == first
+    monkeypatch.setattr(lf, 'CAPTURE_HMAC_KEY', b'two')
+    assert lf.pseudonymize('S1001') != first
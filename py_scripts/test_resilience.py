@@ -0,0 +1,305 @@
+import gzip
+import json
+import os
+import time
+
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+
+import pytest
+
+import lambda_function as lf
+from replay_transcripts import LambdaContext, LocalClient, LocalTable
+
+COURSES = [{'course_id': 'CS101', 'course_name': 'Introduction to Programming', 'capacity': 40, 'enrolled_count': 2}]
+
+
+class CountingTable(LocalTable):
+    """LocalTable that counts the calls that actually reach it."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.calls = 0
+
+    def _simulate(self, operation):
+        self.calls += 1
+        super()._simulate(operation)
+
+    def get_item(self, Key, **kwargs):
+        if not isinstance(Key['course_id'], str):
+            # Stands in for boto3's serializer rejecting a value
+            raise TypeError("Unsupported type")
+        return super().get_item(Key, **kwargs)
+
+
+@pytest.fixture(autouse=True)
+def breaker_settings(monkeypatch):
+    monkeypatch.setattr(lf, 'BREAKER_MIN_CALLS', 5)
+    monkeypatch.setattr(lf, 'BREAKER_ERROR_RATE', 0.5)
+    monkeypatch.setattr(lf, 'BREAKER_COOLDOWN', 10)
+
+
+def throttled_courses(**kwargs):
+    table = CountingTable('Courses', COURSES, throttle_rate=1.0, **kwargs)
+    return table, lf.GuardedTable(table, 'Courses')
+
+
+def trip(guarded):
+    for _ in range(lf.BREAKER_MIN_CALLS):
+        with pytest.raises(lf.TableUnavailableError):
+            guarded.scan()
+
+
+def test_breaker_opens_at_threshold():
+    _, guarded = throttled_courses()
+    for _ in range(lf.BREAKER_MIN_CALLS - 1):
+        with pytest.raises(lf.TableUnavailableError):
+            guarded.scan()
+        assert guarded.breaker.opened_at is None
+
+    with pytest.raises(lf.TableUnavailableError):
+        guarded.scan()
+    assert guarded.breaker.opened_at is not None
+
+
+def test_open_breaker_fails_fast():
+    table, guarded = throttled_courses()
+    trip(guarded)
+    calls = table.calls
+
+    with pytest.raises(lf.TableUnavailableError, match="circuit is open"):
+        guarded.scan()
+    assert table.calls == calls
+
+
+def test_successful_calls_keep_breaker_closed():
+    table = CountingTable('Courses', COURSES)
+    guarded = lf.GuardedTable(table, 'Courses')
+    for _ in range(lf.BREAKER_MIN_CALLS * 2):
+        assert guarded.get_item(Key={'course_id': 'CS101'})['Item']['course_id'] == 'CS101'
+    assert guarded.breaker.opened_at is None
+
+
+def test_half_open_trial_success_closes():
+    table, guarded = throttled_courses()
+    trip(guarded)
+    guarded.breaker.opened_at -= lf.BREAKER_COOLDOWN
+
+    table.throttle_rate = 0.0
+    assert guarded.scan()['Items']
+    assert guarded.breaker.opened_at is None
+    assert not guarded.breaker.half_open
+
+
+def test_half_open_trial_failure_reopens():
+    table, guarded = throttled_courses()
+    trip(guarded)
+    guarded.breaker.opened_at -= lf.BREAKER_COOLDOWN
+
+    with pytest.raises(lf.TableUnavailableError):
+        guarded.scan()
+    calls = table.calls
+    with pytest.raises(lf.TableUnavailableError, match="circuit is open"):
+        guarded.scan()
+    assert table.calls == calls
+
+
+def test_half_open_trial_settles_on_unexpected_exception():
+    table, guarded = throttled_courses()
+    trip(guarded)
+    guarded.breaker.opened_at -= lf.BREAKER_COOLDOWN
+
+    with pytest.raises(TypeError):
+        guarded.get_item(Key={'course_id': 1.5})
+    assert not guarded.breaker.half_open
+    assert guarded.breaker.allow()
+
+
+def test_call_refused_near_deadline(monkeypatch):
+    table = CountingTable('Courses', COURSES, latency_ms=20)
+    guarded = lf.GuardedTable(table, 'Courses')
+    context = LambdaContext(lf.ATTEMPT_BUDGET_MS)
+    monkeypatch.setattr(lf._invocation, 'context', context, raising=False)
+
+    with pytest.raises(lf.TableUnavailableError, match="Not enough time"):
+        guarded.scan()
+    assert table.calls == 0
+
+
+def test_init_rejects_timeout_that_cannot_fit_an_attempt():
+    with pytest.raises(RuntimeError, match="cannot fit one DynamoDB attempt"):
+        lf.check_timeout_budget(lf.ATTEMPT_BUDGET_MS)
+    lf.check_timeout_budget(3000)
+
+
+def test_slow_call_within_deadline_succeeds(monkeypatch):
+    table = CountingTable('Courses', COURSES, latency_ms=20)
+    guarded = lf.GuardedTable(table, 'Courses')
+    monkeypatch.setattr(lf._invocation, 'context', LambdaContext(30000), raising=False)
+
+    assert guarded.scan()['Items'] == COURSES
+    assert guarded.breaker.outcomes[-1] is True
+
+
+@pytest.fixture
+def tenant(monkeypatch):
+    tables = {
+        'Courses': CountingTable('Courses', COURSES),
+        'Registrations': CountingTable('Registrations'),
+    }
+    monkeypatch.setattr(lf, '_tenants', {})
+    monkeypatch.setattr(lf.Tenant, '_create_table', lambda self, base_name: tables[base_name])
+    monkeypatch.setattr(lf.Tenant, '_create_client',
+                        lambda self: LocalClient(lambda name: tables[name[len(self.table_prefix):]]))
+    tenant = lf.get_tenant(lf.DEFAULT_TENANT)
+    tenant.stubs = tables
+    return tenant
+
+
+def test_catalog_falls_back_to_last_good_scan(tenant):
+    items, stale = lf.get_course_catalog(tenant)
+    assert items == COURSES and not stale
+
+    tenant.catalog_cache['fetched_at'] -= lf.CATALOG_CACHE_TTL
+    tenant.stubs['Courses'].throttle_rate = 1.0
+    items, stale = lf.get_course_catalog(tenant)
+    assert items == COURSES and stale
+
+
+def test_catalog_without_cache_raises(tenant):
+    tenant.stubs['Courses'].throttle_rate = 1.0
+    with pytest.raises(lf.TableUnavailableError):
+        lf.get_course_catalog(tenant)
+
+
+def test_handler_replies_try_again_when_table_unavailable(tenant):
+    tenant.stubs['Registrations'].throttle_rate = 1.0
+    event = {
+        'sessionState': {
+            'intent': {'name': 'ViewRegisteredCoursesIntent', 'slots': {}},
+            'sessionAttributes': {'student_id': 'S1001', 'name': 'Alice'}
+        }
+    }
+    response = lf.lambda_handler(event, LambdaContext(30000))
+
+    assert response['sessionState']['intent']['state'] == 'Failed'
+    assert response['messages'][0]['content'] == lf.TRY_AGAIN_MESSAGE
+
+
+@pytest.mark.parametrize('age, stale', [(0, False), (3600, True)])
+def test_snapshot_catalog_is_stale_unless_recent(tenant, tmp_path, monkeypatch, age, stale):
+    path = tmp_path / 'catalog_snapshot.json.gz'
+    with gzip.open(path, 'wt', encoding='utf-8') as f:
+        json.dump({'version': lf.CATALOG_SNAPSHOT_VERSION, 'generated_at': time.time() - age,
+                   'tenants': {tenant.name: COURSES}}, f)
+    monkeypatch.setattr(lf, 'CATALOG_SNAPSHOT', str(path))
+    lf.warm_up()
+
+    assert lf.get_course_catalog(tenant) == (COURSES, stale)
+    assert tenant.stubs['Courses'].calls == 0
+
+
+@pytest.mark.parametrize('snapshot', [
+    [COURSES],
+    {'version': lf.CATALOG_SNAPSHOT_VERSION, 'generated_at': 'yesterday', 'tenants': {}},
+    {'version': lf.CATALOG_SNAPSHOT_VERSION, 'generated_at': 0, 'tenants': COURSES},
+    {'version': lf.CATALOG_SNAPSHOT_VERSION, 'generated_at': 0, 'tenants': {lf.DEFAULT_TENANT: COURSES[0]}},
+    {'version': lf.CATALOG_SNAPSHOT_VERSION, 'generated_at': 0, 'tenants': {lf.DEFAULT_TENANT: ['CS101']}},
+])
+def test_malformed_snapshot_is_ignored(tenant, tmp_path, monkeypatch, snapshot):
+    path = tmp_path / 'catalog_snapshot.json.gz'
+    with gzip.open(path, 'wt', encoding='utf-8') as f:
+        json.dump(snapshot, f)
+    monkeypatch.setattr(lf, 'CATALOG_SNAPSHOT', str(path))
+
+    with pytest.raises(ValueError):
+        lf.load_catalog_snapshot(str(path))
+    assert lf.warm_up() == [tenant.name]
+    assert lf.get_course_catalog(tenant) == (COURSES, False)
+    assert tenant.stubs['Courses'].calls == 1
+
+
+def test_truncated_snapshot_is_ignored(tenant, tmp_path, monkeypatch):
+    path = tmp_path / 'catalog_snapshot.json.gz'
+    path.write_bytes(gzip.compress(json.dumps({'version': 1}).encode('utf-8'))[:-6])
+    monkeypatch.setattr(lf, 'CATALOG_SNAPSHOT', str(path))
+
+    assert lf.warm_up() == [tenant.name]
+    assert tenant.catalog_cache['items'] is None
+
+
+@pytest.mark.parametrize('intent', ['ViewRegisteredCoursesIntent', 'GetAvailableCoursesIntent'])
+def test_default_lambda_timeout_reaches_tables(tenant, intent):
+    event = {
+        'sessionState': {
+            'intent': {'name': intent, 'slots': {}},
+            'sessionAttributes': {'student_id': 'S1001', 'name': 'Alice'}
+        }
+    }
+    response = lf.lambda_handler(event, LambdaContext(3000))
+
+    assert response['sessionState']['intent']['state'] == 'Fulfilled'
+    assert tenant.stubs['Registrations'].calls + tenant.stubs['Courses'].calls > 0
+
+
+def course_event(intent, course_id='CS101'):
+    return {
+        'sessionState': {
+            'intent': {'name': intent, 'slots': {'CourseID': {'value': {'interpretedValue': course_id}}}},
+            'sessionAttributes': {'student_id': 'S1001', 'name': 'Alice'}
+        }
+    }
+
+
+def test_register_writes_row_and_count_together(tenant):
+    response = lf.lambda_handler(course_event('RegisterCourseIntent'), LambdaContext(3000))
+
+    assert response['sessionState']['intent']['state'] == 'Fulfilled'
+    assert tenant.stubs['Courses'].items['CS101']['enrolled_count'] == 3
+    registrations = list(tenant.stubs['Registrations'].items.values())
+    assert [(r['student_id'], r['course_id']) for r in registrations] == [('S1001', 'CS101')]
+
+
+def test_register_rejected_when_course_fills_up(tenant, monkeypatch):
+    # Another student takes the last seat between the read and the write
+    full = dict(COURSES[0], enrolled_count=40)
+    courses = tenant.stubs['Courses']
+    monkeypatch.setattr(courses, 'get_item', lambda Key, **kwargs: {'Item': dict(COURSES[0])})
+    courses.items['CS101'] = full
+
+    response = lf.lambda_handler(course_event('RegisterCourseIntent'), LambdaContext(3000))
+
+    assert response['messages'][0]['content'] == f"{full['course_name']} is full."
+    assert courses.items['CS101']['enrolled_count'] == 40
+    assert tenant.stubs['Registrations'].items == {}
+
+
+def test_throttled_registration_leaves_no_partial_write(tenant, monkeypatch):
+    tenant.stubs['Registrations'].throttle_rate = 1.0
+    monkeypatch.setattr(tenant.stubs['Registrations'], 'query', lambda **kwargs: {'Items': []})
+
+    response = lf.lambda_handler(course_event('RegisterCourseIntent'), LambdaContext(3000))
+
+    assert response['messages'][0]['content'] == lf.TRY_AGAIN_MESSAGE
+    assert tenant.stubs['Courses'].items['CS101']['enrolled_count'] == 2
+    assert tenant.stubs['Registrations'].items == {}
+
+
+def test_repeated_transaction_token_applies_once(tenant):
+    update = {'Update': {
+        'TableName': 'Courses',
+        'Key': {'course_id': 'CS101'},
+        'UpdateExpression': 'SET enrolled_count = enrolled_count + :v',
+        'ExpressionAttributeValues': {':v': 1}
+    }}
+    tenant.transact_write([update], token='reg-retry')
+    tenant.transact_write([update], token='reg-retry')
+    assert tenant.stubs['Courses'].items['CS101']['enrolled_count'] == 3
+
+
+def test_unregister_deletes_row_and_decrements(tenant):
+    lf.lambda_handler(course_event('RegisterCourseIntent'), LambdaContext(3000))
+    response = lf.lambda_handler(course_event('UnregisterCourseIntent'), LambdaContext(3000))
+
+    assert response['sessionState']['intent']['state'] == 'Fulfilled'
+    assert tenant.stubs['Courses'].items['CS101']['enrolled_count'] == 2
+    assert tenant.stubs['Registrations'].items == {}
@@ -0,0 +1,141 @@
+import json
+import logging
+import os
+import random
+import string
+
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+
+import pytest
+
+import lambda_function as lf
+
+# The kind of state upcoming multi-step flows are expected to carry
+REPRESENTATIVE_SCHEMA = {
+    'course_cursor': ('c', str, 16),
+    'page': ('p', int, 4),
+    'pending_course_id': ('r', str, 16),
+    'registered_course_ids': ('g', list, 160),
+    'program': ('m', str, 64),
+}
+
+# Longest plain attributes the frontend can send (src/services/chatbotService.js):
+# Cognito caps usernames at 128 characters and email addresses at 254
+PLAIN_ATTRIBUTE_MAX = {
+    'cognito_username': 128,
+    'email': 254,
+    'name': 100,
+    'student_id': 16,
+    'campus': max(len(name) for name in lf.TENANTS),
+}
+
+
+def incompressible(length):
+    # Random characters defeat zlib, so the packed blob is as large as it gets
+    return ''.join(random.choices(string.ascii_letters + string.digits, k=length))
+
+
+def largest_value(field_type, max_length):
+    if field_type is int:
+        return int('9' * max_length)
+    if field_type is list:
+        return [incompressible(max_length - 4)]
+    return incompressible(max_length - 2)
+
+
+@pytest.fixture
+def schema(monkeypatch):
+    monkeypatch.setattr(lf, 'SESSION_SCHEMA', REPRESENTATIVE_SCHEMA)
+
+
+def test_round_trip(schema):
+    session = lf.SessionState({'student_id': 'S1001'})
+    session.set('course_cursor', 'DB250')
+    session.set('page', 3)
+    attributes = session.encode()
+
+    decoded = lf.SessionState(attributes)
+    assert decoded.get('course_cursor') == 'DB250'
+    assert decoded.get('page') == 3
+    assert decoded.get('pending_course_id') is None
+    assert decoded.attributes == {'student_id': 'S1001'}
+
+
+def test_blob_is_only_decoded_when_touched(schema, monkeypatch):
+    session = lf.SessionState({'student_id': 'S1001'})
+    session.set('page', 2)
+    attributes = session.encode()
+
+    calls = []
+    monkeypatch.setattr(lf, 'decode_session_fields', lambda blob: calls.append(blob) or {})
+    untouched = lf.SessionState(attributes)
+    assert untouched.encode() == attributes
+    assert calls == []
+
+
+def test_no_state_attribute_without_fields(schema):
+    assert lf.SessionState({'student_id': 'S1001'}).encode() == {'student_id': 'S1001'}
+
+
+def test_wrong_schema_version_is_discarded(schema, monkeypatch):
+    session = lf.SessionState({})
+    session.set('page', 2)
+    attributes = session.encode()
+
+    monkeypatch.setattr(lf, 'SESSION_SCHEMA_VERSION', lf.SESSION_SCHEMA_VERSION + 1)
+    assert lf.SessionState(attributes).get('page') is None
+
+
+@pytest.mark.parametrize('blob', ['1z.!!!', '1z.bm90IHpsaWI=', '1j.bm90IGpzb24=', 'garbage', ''])
+def test_garbage_blob_is_discarded(schema, blob):
+    assert lf.SessionState({lf.SESSION_STATE_KEY: blob}).get('page') is None
+
+
+def test_wrong_type_is_rejected(schema):
+    with pytest.raises(TypeError):
+        lf.SessionState({}).set('page', '2')
+
+
+def test_field_longer_than_its_cap_is_rejected(schema):
+    with pytest.raises(ValueError):
+        lf.SessionState({}).set('course_cursor', 'X' * 17)
+
+
+@pytest.mark.parametrize('session_schema', [lf.SESSION_SCHEMA, REPRESENTATIVE_SCHEMA],
+                         ids=['deployed', 'representative'])
+def test_worst_case_session_stays_within_budget(monkeypatch, session_schema):
+    monkeypatch.setattr(lf, 'SESSION_SCHEMA', session_schema)
+    session = lf.SessionState({name: incompressible(length) for name, length in PLAIN_ATTRIBUTE_MAX.items()})
+    for name, (_, field_type, max_length) in session_schema.items():
+        session.set(name, largest_value(field_type, max_length))
+    attributes = session.encode()
+
+    # Nothing was dropped to meet the budget, and the whole map fits
+    assert (lf.SESSION_STATE_KEY in attributes) == bool(session_schema)
+    size = len(json.dumps(attributes, separators=(',', ':'), ensure_ascii=False).encode('utf-8'))
+    assert size <= lf.SESSION_SIZE_BUDGET
+
+
+def test_over_budget_drops_packed_state(schema, monkeypatch):
+    monkeypatch.setattr(lf, 'SESSION_SIZE_BUDGET', 40)
+    session = lf.SessionState({'student_id': 'S1001'})
+    session.set('registered_course_ids', [f"C{i:04d}" for i in range(16)])
+    assert session.encode() == {'student_id': 'S1001'}
+
+
+def test_oversized_plain_attributes_are_logged(caplog):
+    with caplog.at_level(logging.ERROR):
+        attributes = lf.SessionState({'name': 'A' * lf.SESSION_SIZE_BUDGET}).encode()
+    assert attributes == {'name': 'A' * lf.SESSION_SIZE_BUDGET}
+    assert "Plain session attributes alone" in caplog.text
+
+
+def test_elicit_slot_returns_session_attributes(schema, monkeypatch):
+    session = lf.SessionState({'student_id': 'S1001'})
+    session.set('page', 2)
+    monkeypatch.setattr(lf._invocation, 'session', session, raising=False)
+    event = {'sessionState': {'intent': {'name': 'RegisterCourseIntent', 'slots': {}},
+                              'sessionAttributes': {'student_id': 'S1001'}}}
+
+    response = lf.elicit_slot(event, 'CourseID', 'Which course?')
+    assert lf.SessionState(response['sessionState']['sessionAttributes']).get('page') == 2
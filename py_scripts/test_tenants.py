@@ -0,0 +1,61 @@
+import os
+
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+
+import pytest
+
+import lambda_function as lf
+
+TENANTS = {
+    'main': {},
+    'north': {'table_prefix': 'north-', 'aliases': ['north-prod']},
+}
+
+
+@pytest.fixture(autouse=True)
+def tenants(monkeypatch):
+    monkeypatch.setattr(lf, 'TENANTS', TENANTS)
+    monkeypatch.setattr(lf, 'DEFAULT_TENANT', 'main')
+    monkeypatch.setattr(lf, '_tenants', {})
+
+
+def event(intent='LibraryHoursIntent', campus=None, alias=None):
+    attributes = {'student_id': 'S1001'}
+    if campus:
+        attributes[lf.TENANT_ATTRIBUTE] = campus
+    event = {'sessionState': {'intent': {'name': intent, 'slots': {}}, 'sessionAttributes': attributes}}
+    if alias:
+        event['bot'] = {'aliasName': alias}
+    return event
+
+
+@pytest.mark.parametrize('campus, alias, expected', [
+    (None, None, 'main'),
+    ('north', None, 'north'),
+    (None, 'north-prod', 'north'),
+    ('north', 'north-prod', 'north'),
+])
+def test_resolve_tenant(campus, alias, expected):
+    assert lf.resolve_tenant(event(campus=campus, alias=alias)).name == expected
+
+
+def test_campus_conflicting_with_alias_is_rejected():
+    with pytest.raises(lf.UnknownTenantError, match="does not match bot alias"):
+        lf.resolve_tenant(event(campus='main', alias='north-prod'))
+
+
+def test_intent_without_tables_ignores_unknown_campus():
+    response = lf.lambda_handler(event(campus='atlantis'), None)
+    assert response['messages'][0]['content'] != lf.UNKNOWN_CAMPUS_MESSAGE
+    assert lf._tenants == {}
+
+
+def test_table_intent_rejects_unknown_campus():
+    response = lf.lambda_handler(event('ViewRegisteredCoursesIntent', campus='atlantis'), None)
+    assert response['messages'][0]['content'] == lf.UNKNOWN_CAMPUS_MESSAGE
+
+
+def test_init_rejects_undefined_default_tenant(monkeypatch):
+    monkeypatch.setattr(lf, 'DEFAULT_TENANT', 'south')
+    with pytest.raises(RuntimeError, match="DEFAULT_TENANT south"):
+        lf.check_tenants()